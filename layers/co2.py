@@ -5,8 +5,16 @@ import pandas as pd
 import os
 import json
 import urllib.request
+from functools import lru_cache
 from folium.plugins import HeatMap
 
+try:  # SIMD-accelerated JSON parser; stdlib json is the fallback
+    import orjson
+except ImportError:
+    orjson = None
+
+from layers.webgl import WebGLHeatMap, WEBGL_POINT_THRESHOLD
+
 # --- Load CO₂ data from CSV ---
 def get_country_co2_data():
     """Load hardcoded 2023 CO₂ emission data (Mt CO₂)."""
@@ -24,7 +32,19 @@ def get_country_co2_data():
 
 # --- Country coordinates cache (Natural Earth) ---
 COORDS_FILE = os.path.join(os.path.dirname(__file__), "country_coords_ne.json")
-NE_URL = "https://raw.githubusercontent.com/datasets/geo-countries/master/data/countries.geojson"
+COORDS_NPZ = os.path.join(os.path.dirname(__file__), "country_coords_ne.npz")
+# 110m simplified polygons: ~10x smaller than full-resolution geo-countries,
+# and centroids don't need more detail. Normally never fetched anyway since
+# the repo ships a pre-built country_coords_ne.json.
+NE_URL = "https://raw.githubusercontent.com/nvkelso/natural-earth-vector/master/geojson/ne_110m_admin_0_countries.geojson"
+
+def _save_coords_npz(coords):
+    names = np.array(list(coords.keys()), dtype=object)
+    latlon = np.array(list(coords.values()), dtype=np.float32)
+    np.savez_compressed(COORDS_NPZ, names=names, coords=latlon)
+
+def _load_json(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
 
 def _poly_mean(coords):
     arr = np.array(coords, dtype=float)
@@ -32,18 +52,15 @@ def _poly_mean(coords):
     return float(lat), float(lon)
 
 def _largest_outer_ring(multipoly):
-    best = []
-    best_len = -1
-    for poly in multipoly:
-        outer = poly[0] if poly and isinstance(poly[0], list) else []
-        if len(outer) > best_len:
-            best_len = len(outer)
-            best = outer
-    return best
+    return max(
+        (poly[0] for poly in multipoly if poly and isinstance(poly[0], list)),
+        key=len,
+        default=[],
+    )
 
 def generate_country_coords():
     with urllib.request.urlopen(NE_URL) as resp:
-        geo = json.load(resp)
+        geo = _load_json(resp.read())
 
     coords = {}
     for f in geo["features"]:
@@ -70,12 +87,20 @@ def generate_country_coords():
 
     with open(COORDS_FILE, "w", encoding="utf-8") as f:
         json.dump(coords, f)
+    _save_coords_npz(coords)
     return coords
 
+@lru_cache(maxsize=1)
 def get_country_coords():
+    """Centroid dict, parsed once per process and served from memory after."""
+    if os.path.exists(COORDS_NPZ):
+        data = np.load(COORDS_NPZ, allow_pickle=True)
+        return dict(zip(data["names"].tolist(), data["coords"].tolist()))
     if os.path.exists(COORDS_FILE):
-        with open(COORDS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(COORDS_FILE, "rb") as f:
+            coords = _load_json(f.read())
+        _save_coords_npz(coords)  # migrate to the compact format once
+        return coords
     return generate_country_coords()
 
 
@@ -123,19 +148,20 @@ ALIASES = {
     "Greenland": "Greenland",
 }
 
-def resolve_admin_name(name, coords_dict):
-    # Exact
-    if name in coords_dict:
-        return name
-    # Alias
-    alias = ALIASES.get(name)
-    if alias and alias in coords_dict:
-        return alias
-    # Try minor punctuation/diacritics fixes
-    cand = name.replace("’", "'")
-    if cand in coords_dict:
-        return cand
-    return None
+@lru_cache(maxsize=1)
+def _admin_lookup():
+    """Unified name→ADMIN table: exact names, aliases, and apostrophe variants."""
+    coords = get_country_coords()
+    lookup = {name: name for name in coords}
+    lookup.update({wb: admin for wb, admin in ALIASES.items() if admin in coords})
+    for name in coords:
+        lookup.setdefault(name.replace("'", "’"), name)
+        lookup.setdefault(name.replace("’", "'"), name)
+    return lookup
+
+def resolve_admin_name(name, coords_dict=None):
+    # Single dict probe; the coords_dict argument is kept for call-site compat
+    return _admin_lookup().get(name)
 
 
 # --- Folium blurred (heatmap-style) layer ---
@@ -146,21 +172,31 @@ def add_co2_layer(map_obj, co2_df):
     """
     coords = get_country_coords()
 
-    rows = []
-    for _, r in co2_df.iterrows():
-        admin = resolve_admin_name(r["country_key"], coords)
-        if not admin:
-            continue
-        lat, lon = coords[admin]
-        val = float(r["co2_total_mt"])
-        if not np.isfinite(val) or val <= 0:
-            continue
-        rows.append([lat, lon, val])
+    # Resolve aliases and join coordinates column-wise instead of iterrows()
+    coords_df = pd.DataFrame.from_dict(coords, orient="index", columns=["lat", "lon"])
+    merged = (
+        co2_df.assign(admin=co2_df["country_key"].map(lambda n: resolve_admin_name(n, coords)))
+        .dropna(subset=["admin"])
+        .merge(coords_df, left_on="admin", right_index=True)
+    )
+    vals = merged["co2_total_mt"].to_numpy(dtype=float)
+    merged = merged[np.isfinite(vals) & (vals > 0)]
+
+    if merged.empty:
+        return
+
+    # 4 decimals keeps the serialized payload short without visible loss
+    rows = merged[["lat", "lon", "co2_total_mt"]].to_numpy(dtype=float).round(4)
+
+    # One named group per layer, added to the map exactly once
+    group = folium.FeatureGroup(name="CO₂ Emissions")
 
-    if not rows:
+    # Country-level data stays small, but keep the GPU path for parity
+    if len(rows) > WEBGL_POINT_THRESHOLD:
+        WebGLHeatMap(rows.tolist()).add_to(group)
+        group.add_to(map_obj)
         return
 
-    rows = np.array(rows, dtype=float)
     weights = rows[:, 2]
     max_val = float(weights.max())
 
@@ -178,4 +214,5 @@ def add_co2_layer(map_obj, co2_df):
             0.8: "#66c2ff",  # lighter blue
             1.0: "#b3e6ff",  # pale blue-white
         },
-    ).add_to(map_obj)
+    ).add_to(group)
+    group.add_to(map_obj)
@@ -72,22 +72,36 @@ COUNTRY_COORDS = {
     "United States": (37.1, -95.7),
 }
 
+# Aligned arrays built once at import so the layer math stays vectorized
+# (and keeps working if the table ever grows past a handful of countries).
+_NAMES = np.array([c for c in PIPELINE_COUNTS if c in COUNTRY_COORDS])
+_COUNTS = np.array([PIPELINE_COUNTS[c] for c in _NAMES], dtype=np.float32)
+_LATLON = np.array([COUNTRY_COORDS[c] for c in _NAMES], dtype=np.float32)
+
+# The table is static, so normalize once at import; per-render work is just
+# handing the precomputed rows to folium. (Log scale for visual balance.)
+_MASK = _COUNTS > 0
+if _MASK.any():
+    _HEAT_DATA = (
+        np.column_stack(
+            [_LATLON[_MASK], np.log1p(_COUNTS[_MASK]) / np.log1p(float(_COUNTS.max()))]
+        )
+        .astype(np.float64)
+        .round(4)  # short JSON repr for the serialized map payload
+        .tolist()
+    )
+else:
+    _HEAT_DATA = []
+
 def add_pipeline_layer(map_obj):
     """Add blurred heatmap for number of operating pipelines per country."""
-    vals = [v for v in PIPELINE_COUNTS.values() if v > 0]
-    if not vals:
+    if not _HEAT_DATA:
         return
 
-    vmin, vmax = min(vals), max(vals)
-    heat_data = []
+    heat_data = _HEAT_DATA
 
-    for country, count in PIPELINE_COUNTS.items():
-        if count == 0 or country not in COUNTRY_COORDS:
-            continue
-        lat, lon = COUNTRY_COORDS[country]
-        # normalize on a log scale for better visual balance
-        weight = count / vmax
-        heat_data.append([lat, lon, weight])
+    # One named group per layer, added to the map exactly once
+    group = folium.FeatureGroup(name="Pipeline Network")
 
     # Gaussian-blurred intensity map
     HeatMap(
@@ -103,4 +117,5 @@ def add_pipeline_layer(map_obj):
             0.8: "#66ff6b",  # lighter blue
             1.0: "#b3ffb7",  # pale blue-white
         },
-    ).add_to(map_obj)
+    ).add_to(group)
+    group.add_to(map_obj)
@@ -3,12 +3,41 @@ import requests
 import folium
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from folium.plugins import HeatMap
 import streamlit as st
 
+from layers.webgl import WebGLHeatMap, WEBGL_POINT_THRESHOLD
+
 BASE_URL = "https://power.larc.nasa.gov/api/temporal/climatology/point"
+REGIONAL_URL = "https://power.larc.nasa.gov/api/temporal/climatology/regional"
 PARAM = "ALLSKY_SFC_SW_DWN"
-CACHE_FILE = "data/solar_cache.json"
+CACHE_FILE = "data/solar_cache.npz"
+LEGACY_CACHE_FILE = "data/solar_cache.json"  # pre-npz cache, migrated on load
+MAX_WORKERS = 32
+TILE_DEG = 10  # the regional endpoint caps requests at a 10°x10° box
+
+# One session for all workers so TCP/TLS handshakes amortize across requests.
+# The default adapter keeps only 10 connections alive; size the pool to the
+# worker count so every thread reuses a warm connection instead of
+# re-handshaking with power.larc.nasa.gov.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    requests.adapters.HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS),
+)
+
+
+def _save_cache(points):
+    """Persist points as a compressed binary array and return the ndarray.
+
+    Binary float I/O skips the decimal round-trip JSON pays per value, and
+    the (N, 3) float32 array feeds straight into the heatmap builders.
+    """
+    arr = np.asarray(points, dtype=np.float32)
+    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+    np.savez_compressed(CACHE_FILE, points=arr)
+    return arr
 
 
 @st.cache_data(show_spinner=False)
@@ -16,7 +45,7 @@ def _fetch_point_data(lat, lon):
     """Cached low-level call to NASA POWER."""
     url = f"{BASE_URL}?parameters={PARAM}&community=RE&longitude={lon}&latitude={lat}&format=JSON"
     try:
-        res = requests.get(url, timeout=10)
+        res = _SESSION.get(url, timeout=10)
         res.raise_for_status()
         data = res.json()
         ghi_vals = list(data["properties"]["parameter"][PARAM].values())
@@ -25,6 +54,56 @@ def _fetch_point_data(lat, lon):
         return np.nan
 
 
+def _fetch_region(lat_min, lat_max, lon_min, lon_max):
+    """One regional call covering a bounding box; returns [(lat, lon, mean GHI)]."""
+    url = (
+        f"{REGIONAL_URL}?parameters={PARAM}&community=RE&format=JSON"
+        f"&latitude-min={lat_min}&latitude-max={lat_max}"
+        f"&longitude-min={lon_min}&longitude-max={lon_max}"
+    )
+    res = _SESSION.get(url, timeout=30)
+    res.raise_for_status()
+    points = []
+    for feat in res.json().get("features", []):
+        coords = feat.get("geometry", {}).get("coordinates") or []
+        ghi = feat.get("properties", {}).get("parameter", {}).get(PARAM, {})
+        if len(coords) < 2 or not ghi:
+            continue
+        lon, lat = coords[0], coords[1]
+        points.append((float(lat), float(lon), float(np.mean(list(ghi.values())))))
+    return points
+
+
+def _fetch_regional_grid(lat_step, lon_step, progress_bar=None, progress_text=None, max_workers=MAX_WORKERS):
+    """Cover the globe with regional calls and keep points on the requested grid.
+
+    Collapses the per-point round-trips into one request per 10°x10° tile, so
+    the fetch is bandwidth- rather than latency-bound. Only worth it when the
+    grid is finer than the tile size; callers fall back to per-point fetches
+    otherwise.
+    """
+    tiles = [
+        (la, min(la + TILE_DEG, 90), lo, min(lo + TILE_DEG, 180))
+        for la in range(-90, 90, TILE_DEG)
+        for lo in range(-180, 180, TILE_DEG)
+    ]
+    total = len(tiles)
+    points = []
+    # Tiles are independent, so fetch them concurrently over the shared session
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures = [ex.submit(_fetch_region, *tile) for tile in tiles]
+        for done, fut in enumerate(as_completed(futures), start=1):
+            for lat, lon, val in fut.result():
+                # the API returns its native resolution; subsample to our grid
+                if (lat + 90) % lat_step < 0.25 and (lon + 180) % lon_step < 0.25:
+                    points.append((lat, lon, val))
+            if progress_bar:
+                progress_bar.progress(done / total)
+            if progress_text:
+                progress_text.text(f"Fetching data… (tile {done}/{total})")
+    return points
+
+
 @st.cache_data(show_spinner=False)
 def _generate_grid(lat_step, lon_step):
     """Cached generation of coordinate grid."""
@@ -33,7 +112,7 @@ def _generate_grid(lat_step, lon_step):
     return [(lat, lon) for lat in lats for lon in lons]
 
 
-def get_global_solar_points(lat_step=50, lon_step=50, progress_bar=None, progress_text=None, skip_factor=1):
+def get_global_solar_points(lat_step=50, lon_step=50, progress_bar=None, progress_text=None, skip_factor=1, max_workers=MAX_WORKERS):
     """
     Fetch global solar irradiance points.
     - Uses local JSON cache to skip API calls after first fetch.
@@ -41,52 +120,82 @@ def get_global_solar_points(lat_step=50, lon_step=50, progress_bar=None, progres
     """
     # Load cached data if available
     if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r") as f:
+        try:
+            data = np.load(CACHE_FILE)["points"]
+            if data.size:
+                return data
+        except Exception:
+            pass  # bad cache, fall through to refetch
+    if os.path.exists(LEGACY_CACHE_FILE):
+        # migrate the old JSON cache to binary once
+        with open(LEGACY_CACHE_FILE, "r") as f:
             try:
                 data = json.load(f)
                 if data:
-                    return [(float(lat), float(lon), float(val)) for lat, lon, val in data]
+                    return _save_cache(data)
             except Exception:
-                pass  # bad cache, fall through to refetch
+                pass
+
+    # Dense grids: batch via the regional endpoint, one call per tile.
+    if lat_step < TILE_DEG and lon_step < TILE_DEG and skip_factor == 1:
+        try:
+            points = _fetch_regional_grid(lat_step, lon_step, progress_bar, progress_text, max_workers)
+            if points:
+                return _save_cache(points)
+        except Exception:
+            pass  # regional endpoint unavailable, fall back to per-point
 
     grid = _generate_grid(lat_step, lon_step)
+    if skip_factor > 1:
+        grid = grid[::skip_factor]
     total = len(grid)
     points = []
 
-    for i, (lat, lon) in enumerate(grid, start=1):
-        if i % skip_factor != 0:
-            continue
-        val = _fetch_point_data(lat, lon)
-        if not np.isnan(val):
-            # cast to plain Python types right here
-            points.append((float(lat), float(lon), float(val)))
-        if progress_bar:
-            progress_bar.progress(i / total)
-        if progress_text and i % 10 == 0:
-            progress_text.text(f"Fetching data… ({i}/{total})")
+    # The fetches are pure network latency, so overlap them with a thread pool
+    # instead of paying one round-trip per grid cell.
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures = {ex.submit(_fetch_point_data, lat, lon): (lat, lon) for lat, lon in grid}
+        for done, fut in enumerate(as_completed(futures), start=1):
+            lat, lon = futures[fut]
+            val = fut.result()
+            if not np.isnan(val):
+                # cast to plain Python types right here
+                points.append((float(lat), float(lon), float(val)))
+            if progress_bar:
+                progress_bar.progress(done / total)
+            if progress_text and done % 10 == 0:
+                progress_text.text(f"Fetching data… ({done}/{total})")
 
     # Cache results locally for next run
-    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
-    with open(CACHE_FILE, "w") as f:
-        json.dump(points, f)  # now fully serializable
-
-    return points
+    return _save_cache(points)
 
 
 def add_solar_points_layer(map_obj, points):
     """Add blurred solar irradiance heatmap layer."""
-    vals = [p[2] for p in points if not np.isnan(p[2])]
-    if not vals:
+    arr = np.asarray(points, dtype=np.float32)
+    if arr.size == 0:
+        return
+    arr = arr[~np.isnan(arr[:, 2])]
+    if not len(arr):
         return
-    vmin, vmax = min(vals), max(vals)
 
-    # Normalize & build heatmap data
-    heat_data = []
-    for lat, lon, val in points:
-        if np.isnan(val):
-            continue
-        weight = (val - vmin) / (vmax - vmin)
-        heat_data.append([lat, lon, weight])
+    # Normalize the value column in one vectorized pass
+    vals = arr[:, 2]
+    vmin, vmax = float(vals.min()), float(vals.max())
+    weights = (vals - vmin) / (vmax - vmin) if vmax > vmin else np.ones_like(vals)
+    # float64 then round: 4 decimals is ample for rendering and keeps the
+    # serialized payload short (raw float32 repr drags in ~17 digits)
+    heat_data = np.column_stack([arr[:, :2], weights]).astype(np.float64).round(4).tolist()
+
+    # One named group per layer keeps the rendered tree flat and lets
+    # LayerControl toggle it as a unit.
+    group = folium.FeatureGroup(name="Solar Irradiance")
+
+    # Canvas heatmaps choke on dense grids; hand those to the GPU
+    if len(heat_data) > WEBGL_POINT_THRESHOLD:
+        WebGLHeatMap(heat_data).add_to(group)
+        group.add_to(map_obj)
+        return
 
     # Add Gaussian-blurred heatmap
     HeatMap(
@@ -102,4 +211,5 @@ def add_solar_points_layer(map_obj, points):
             0.8: "#fff566",
             1.0: "#fffeb3",
         },
-    ).add_to(map_obj)
+    ).add_to(group)
+    group.add_to(map_obj)
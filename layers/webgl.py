@@ -0,0 +1,47 @@
+# layers/webgl.py
+import json
+
+from branca.element import JavascriptLink, MacroElement
+from jinja2 import Template
+
+# Canvas-based Leaflet.heat starts to stall past a few thousand points;
+# above this count the layer helpers switch to the GPU path.
+WEBGL_POINT_THRESHOLD = 5000
+
+_WEBGL_JS = "https://ursudio.com/webgl-heatmap-leaflet/webgl-heatmap-leaflet.js"
+
+
+class WebGLHeatMap(MacroElement):
+    """GPU-rendered heatmap for large point sets.
+
+    Drop-in alternative to folium.plugins.HeatMap backed by
+    webgl-heatmap-leaflet, which splats points in a fragment shader instead
+    of looping over canvas pixels. Takes the same [lat, lon, weight] rows.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.webGLHeatmap({
+            size: {{ this.size }},
+            units: 'px',
+            opacity: {{ this.opacity }}
+        });
+        {{ this.get_name() }}.setData({{ this.data }});
+        {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, data, size=30, opacity=0.7):
+        super().__init__()
+        self._name = "WebGLHeatMap"
+        self.data = json.dumps([[float(r[0]), float(r[1]), float(r[2])] for r in data])
+        self.size = size
+        self.opacity = opacity
+
+    def render(self, **kwargs):
+        super().render(**kwargs)
+        self.get_root().header.add_child(
+            JavascriptLink(_WEBGL_JS), name="webgl-heatmap-leaflet"
+        )
@@ -1,33 +1,258 @@
+import os
+import urllib.request
+from functools import lru_cache
+
 import streamlit as st
+import streamlit.components.v1 as components
 import folium
 import numpy as np
-from folium.plugins import HeatMap
-from streamlit_folium import st_folium
 import geopandas as gpd
-from shapely.geometry import Point
+import shapely
+from rasterio import features as rio_features
+from rasterio.transform import from_bounds
 
 from layers.solar import get_global_solar_points, add_solar_points_layer
 from layers.pipelines import PIPELINE_COUNTS, COUNTRY_COORDS, add_pipeline_layer
 from layers.co2 import get_country_co2_data, add_co2_layer, get_country_coords, resolve_admin_name
-
-# --- Load Natural Earth land mask ---
-import geopandas as gpd
-from shapely.geometry import Point
+from layers.raster import add_heat_overlay
 
 # --- Load land polygons (Natural Earth) ---
 LAND_URL = "https://naciscdn.org/naturalearth/110m/cultural/ne_110m_admin_0_countries.zip"
-try:
-    LAND = gpd.read_file(LAND_URL)
-except Exception as e:
-    st.warning(f"Failed to load land polygons: {e}")
-    LAND = gpd.GeoDataFrame(columns=["geometry"])
+LAND_CACHE = os.path.join("data", "ne_110m_admin_0_countries.zip")
 
-def is_on_land(lat, lon):
-    """Return True if coordinate is on land (using Natural Earth polygons)."""
-    if LAND.empty:
+@st.cache_resource(show_spinner=False)
+def load_land():
+    """Download and parse the land polygons once per process, not per rerun.
+
+    The zip is kept under data/ so worker restarts skip the network, and
+    parsing goes through pyogrio's bulk C reader rather than the default
+    per-feature path. Deliberately not called at module level: only the
+    Terraformer layer needs the land mask, so sessions that never select it
+    never pay for the download and parse.
+    """
+    try:
+        if not os.path.exists(LAND_CACHE):
+            os.makedirs(os.path.dirname(LAND_CACHE), exist_ok=True)
+            urllib.request.urlretrieve(LAND_URL, LAND_CACHE + ".part")
+            os.replace(LAND_CACHE + ".part", LAND_CACHE)
+        return gpd.read_file(LAND_CACHE, engine="pyogrio")
+    except Exception as e:
+        st.warning(f"Failed to load land polygons: {e}")
+        return gpd.GeoDataFrame(columns=["geometry"])
+
+@st.cache_resource(show_spinner=False)
+def load_land_union():
+    """All land polygons merged into one prepared geometry.
+
+    One prepared contains() against the union replaces a dispatch across
+    every country polygon; GEOS indexes the prepared geometry internally.
+    """
+    land = load_land()
+    if land.empty:
+        return None
+    union = land.geometry.union_all()
+    shapely.prepare(union)
+    return union
+
+@lru_cache(maxsize=4096)
+def _is_on_land_cached(lat, lon):
+    union = load_land_union()
+    if union is None:
         return True  # fallback to avoid breaking
-    point = Point(lon, lat)
-    return LAND.contains(point).any()
+    return bool(shapely.contains_xy(union, lon, lat))
+
+def is_on_land(lat, lon):
+    """Return True if coordinate is on land (using Natural Earth polygons).
+
+    Scalar convenience path; results are memoized on rounded coordinates
+    since the same country centroids come back every rerun. Batches should
+    use mask_on_land instead.
+    """
+    return _is_on_land_cached(round(lat, 4), round(lon, 4))
+
+@st.cache_resource(show_spinner=False)
+def load_land_tree():
+    """STRtree over prepared land geometries, for the vector mask path.
+
+    Preparing the geometries once means each candidate from the R-tree is
+    verified with a cached GEOS prepared-intersects instead of a full
+    point-in-polygon test — this is what keeps high-resolution grids viable
+    when the raster mask is too coarse or unavailable.
+    """
+    geoms = load_land().geometry.values
+    shapely.prepare(geoms)
+    return shapely.STRtree(geoms)
+
+# Raster land mask: 0.1° is plenty for our coarse grids, and it turns each
+# land check into a single array index instead of a polygon query.
+MASK_RES = 10  # cells per degree
+
+@st.cache_resource(show_spinner=False)
+def load_land_mask():
+    """Rasterize the land polygons once into a 0.1-degree boolean bitmap."""
+    land = load_land()
+    if land.empty:
+        return None
+    shape = (180 * MASK_RES, 360 * MASK_RES)
+    try:
+        mask = rio_features.rasterize(
+            ((geom, 1) for geom in land.geometry),
+            out_shape=shape,
+            transform=from_bounds(-180, -90, 180, 90, shape[1], shape[0]),
+            fill=0,
+            dtype="uint8",
+        )
+    except Exception:
+        return None
+    return mask.astype(bool)
+
+def mask_on_land(lats, lons):
+    """Boolean land mask for whole coordinate arrays.
+
+    Prefers the rasterized bitmap (one integer index per point); falls back
+    to a single STRtree spatial-index query if rasterization failed.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if load_land().empty:
+        return np.ones(len(lats), dtype=bool)  # fallback to avoid breaking
+    mask = load_land_mask()
+    if mask is not None:
+        i = np.clip(((90.0 - lats) * MASK_RES).astype(np.int32), 0, mask.shape[0] - 1)
+        j = np.clip(((lons + 180.0) * MASK_RES).astype(np.int32), 0, mask.shape[1] - 1)
+        return mask[i, j]
+    points = shapely.points(lons, lats)
+    pt_idx, _ = load_land_tree().query(points, predicate="intersects")
+    return np.bincount(pt_idx, minlength=len(points)) > 0
+
+@st.cache_data(show_spinner=False)
+def cached_land_mask(latlon):
+    """Memoized land mask for an (N, 2) coordinate array.
+
+    The solar grid and country centroids are identical on every rebuild, so
+    keying on the array contents turns the repeat mask queries into cache
+    hits.
+    """
+    return mask_on_land(latlon[:, 0], latlon[:, 1])
+
+# --- Cached base-layer loads ---
+# Moving a slider re-runs this whole script; the base layers don't depend on
+# the weights, so cache them and let reruns only recompute the composite.
+@st.cache_data(show_spinner=False)
+def load_solar_points(lat_step, lon_step, max_workers=16):
+    return get_global_solar_points(
+        lat_step=lat_step, lon_step=lon_step, max_workers=max_workers
+    )
+
+
+@st.cache_data(show_spinner=False)
+def load_co2_data():
+    return get_country_co2_data()
+
+
+# --- Map construction, cached per control configuration ---
+# Rendering the folium map to HTML is the slow part of a rerun; keying the
+# whole build on the selected layers and (rounded) weights means repeat
+# slider states and pan/zoom reruns reuse the rendered string outright.
+@st.cache_resource(show_spinner=False)
+def build_map(layers_tuple, solar_weight, pipeline_weight, co2_weight):
+    """Build the map for one control configuration and return its HTML."""
+    m = folium.Map(location=[20, 0], zoom_start=2, tiles="cartodb positron")
+
+    # --- Load data ---
+    solar_points, co2_df = None, None
+
+    # A zero weight means a layer contributes nothing to the composite, so
+    # don't fetch or process it unless it's also displayed on its own.
+    terraformer = "Terraformer Effectiveness" in layers_tuple
+    want_solar = solar_weight > 1e-6
+    want_pipelines = pipeline_weight > 1e-6
+    want_co2 = co2_weight > 1e-6
+
+    if "Solar Irradiance" in layers_tuple or (terraformer and want_solar):
+        with st.spinner("Fetching solar data…"):
+            solar_points = load_solar_points(20, 20)
+        if "Solar Irradiance" in layers_tuple:
+            add_solar_points_layer(m, solar_points)
+
+    if "Pipeline Network" in layers_tuple:
+        add_pipeline_layer(m)
+
+    if "CO₂ Emissions" in layers_tuple or (terraformer and want_co2):
+        co2_df = load_co2_data()
+        if "CO₂ Emissions" in layers_tuple:
+            add_co2_layer(m, co2_df)
+
+    # --- Terraformer Effectiveness Layer ---
+    if terraformer:
+        heat_stacks = []
+        coords_dict = get_country_coords()
+
+        # Solar points (global grid) — normalize the whole column in one pass
+        if want_solar and solar_points is not None and len(solar_points):
+            # already a float32 (N, 3) array, and st.cache_data hands each
+            # caller its own copy, so in-place normalization is safe
+            solar_arr = np.asarray(solar_points, dtype=np.float32)
+            svals = solar_arr[:, 2]
+            srange = float(np.ptp(svals))
+            np.subtract(svals, float(svals.min()), out=svals)
+            if srange > 0:
+                np.divide(svals, srange, out=svals)
+            np.clip(svals, 0.0, 1.0, out=svals)
+            land = cached_land_mask(solar_arr[:, :2])
+            heat_stacks.append(
+                np.column_stack([solar_arr[land, :2], solar_weight * svals[land]]).astype(np.float64)
+            )
+
+        # Pipelines (country centroids)
+        pipe_names = [c for c in PIPELINE_COUNTS if c in COUNTRY_COORDS] if want_pipelines else []
+        if pipe_names:
+            pipe_latlon = np.array([COUNTRY_COORDS[c] for c in pipe_names], dtype=np.float64)
+            pipe_counts = np.array([PIPELINE_COUNTS[c] for c in pipe_names], dtype=np.float64)
+            pvals = pipe_counts / pipe_counts.max()
+            land = cached_land_mask(pipe_latlon)
+            heat_stacks.append(
+                np.column_stack([pipe_latlon[land], pipeline_weight * pvals[land]])
+            )
+
+        # CO₂ (country centroids)
+        if want_co2 and co2_df is not None:
+            # resolve each distinct key once, then map the column through a dict
+            key_to_coord = {
+                k: coords_dict.get(resolve_admin_name(k, coords_dict))
+                for k in co2_df["country_key"].unique()
+            }
+            co2_coords = co2_df["country_key"].map(key_to_coord)
+            cvals = co2_df["co2_total_mt"].to_numpy(dtype=float)
+            keep = co2_coords.notna().to_numpy() & np.isfinite(cvals) & (cvals > 0)
+            if keep.any():
+                co2_latlon = np.array(co2_coords[keep].tolist(), dtype=np.float64)
+                cnorm = cvals[keep] / float(np.nanmax(cvals))
+                land = cached_land_mask(co2_latlon)
+                heat_stacks.append(
+                    np.column_stack([co2_latlon[land], co2_weight * cnorm[land]])
+                )
+
+        # Combine into a single pre-binned raster overlay — the browser blits
+        # one image instead of splatting every heat point on the canvas
+        heat_stacks = [arr for arr in heat_stacks if arr.size]
+        heat_points = np.vstack(heat_stacks) if heat_stacks else np.empty((0, 3))
+        if len(heat_points):
+            add_heat_overlay(
+                m,
+                heat_points,
+                res=2.0,
+                sigma=2.0,
+                cmap_name="RdPu",
+                name="Terraformer Effectiveness",
+            )
+        else:
+            st.warning("No data available to render Terraformer layer.")
+
+    # --- Add map controls ---
+    folium.LayerControl().add_to(m)
+    return m._repr_html_()
+
 
 # --- Streamlit setup ---
 st.set_page_config(layout="wide")
@@ -54,101 +279,16 @@ if total > 0:
     pipeline_weight /= total
     co2_weight /= total
 
-# --- Base map setup ---
-m = folium.Map(location=[20, 0], zoom_start=2, tiles="cartodb positron")
-
-# --- Load data ---
-solar_points, co2_df = None, None
-
-if "Solar Irradiance" in layer_choices or "Terraformer Effectiveness" in layer_choices:
-    progress_text = st.empty()
-    progress_bar = st.progress(0.0)
-    solar_points = get_global_solar_points(
-        lat_step=20, lon_step=20, progress_bar=progress_bar, progress_text=progress_text
-    )
-    progress_bar.empty()
-    progress_text.empty()
-    if "Solar Irradiance" in layer_choices:
-        add_solar_points_layer(m, solar_points)
-
-if "Pipeline Network" in layer_choices:
-    add_pipeline_layer(m)
-
-if "CO₂ Emissions" in layer_choices or "Terraformer Effectiveness" in layer_choices:
-    co2_df = get_country_co2_data()
-    if "CO₂ Emissions" in layer_choices:
-        add_co2_layer(m, co2_df)
-
-# --- Terraformer Effectiveness Layer ---
-if "Terraformer Effectiveness" in layer_choices:
-    heat_points = []
-    coords_dict = get_country_coords()
-
-    # Solar points (global grid)
-    if solar_points:
-        solar_vals = [p[2] for p in solar_points]
-        smin, smax = min(solar_vals), max(solar_vals)
-        for lat, lon, val in solar_points:
-            if not is_on_land(lat, lon):
-                continue
-            sval = (val - smin) / (smax - smin)
-            heat_points.append([lat, lon, solar_weight * sval])
-
-    # Pipelines (country centroids)
-    p_vals = list(PIPELINE_COUNTS.values())
-    if p_vals:
-        pmax = max(p_vals)
-        for c, count in PIPELINE_COUNTS.items():
-            if c not in COUNTRY_COORDS:
-                continue
-            lat, lon = COUNTRY_COORDS[c]
-            if not is_on_land(lat, lon):
-                continue
-            pval = count / pmax
-            heat_points.append([lat, lon, pipeline_weight * pval])
-
-    # CO₂ (country centroids)
-    if co2_df is not None:
-        co2_vals = co2_df["co2_total_mt"].values
-        cmax = float(np.nanmax(co2_vals))
-        for _, row in co2_df.iterrows():
-            admin = resolve_admin_name(row["country_key"], coords_dict)
-            if not admin:
-                continue
-            lat, lon = coords_dict[admin]
-            if not is_on_land(lat, lon):
-                continue
-            val = float(row["co2_total_mt"])
-            if not np.isfinite(val) or val <= 0:
-                continue
-            norm_val = val / cmax
-            heat_points.append([lat, lon, co2_weight * norm_val])
-
-    # Combine into final layer
-    if heat_points:
-        HeatMap(
-            heat_points,
-            name="Terraformer Effectiveness",
-            min_opacity=0.25,
-            max_opacity=0.95,
-            radius=45,
-            blur=90,
-            gradient={
-                0.0: "#FFE6F7",
-                0.3: "#fbabdf",
-                0.6: "#fc87ef",
-                0.8: "#fb4ed2",
-                1.0: "#B1078F",
-            },
-        ).add_to(m)
-    else:
-        st.warning("No data available to render Terraformer layer.")
-
-# --- Add map controls and render ---
-folium.LayerControl().add_to(m)
-st_folium(m, width=1100, height=600)
+# --- Build (or fetch the cached) map and render ---
+map_html = build_map(
+    tuple(sorted(layer_choices)),
+    round(solar_weight, 3),
+    round(pipeline_weight, 3),
+    round(co2_weight, 3),
+)
+components.html(map_html, height=600, scrolling=False)
 
 st.subheader("Data Sources")
-st.markdown( """ - **Solar Irradiance:** [NASA POWER API](https://power.larc.nasa.gov/data-access-viewer/) 
-            \n- **Pipeline Network:** [Global Energy Monitor – Global NGL pipeline km by country](https://globalenergymonitor.org/projects/global-oil-infrastructure-tracker/) 
+st.markdown( """ - **Solar Irradiance:** [NASA POWER API](https://power.larc.nasa.gov/data-access-viewer/)
+            \n- **Pipeline Network:** [Global Energy Monitor – Global NGL pipeline km by country](https://globalenergymonitor.org/projects/global-oil-infrastructure-tracker/)
             \n- **CO₂ Emissions:** [World Bank Group – Carbon dioxide (CO2) emissions (total)](https://data.worldbank.org/indicator/EN.GHG.CO2.MT.CE.AR5?end=2023&name_desc=true&start=2023&view=map) """, unsafe_allow_html=True, )